@@ -1,26 +1,64 @@
 import base64
 import os
+import time
 
 import requests
 import logging
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("canon-camera")
 
+# How long a fetched setting is trusted before asking the camera again
+SETTING_CACHE_TTL = 2.0
+
+# Liveview scroll stream framing: start ID, data type, 4-byte big-endian size, data, end ID
+SCROLL_START_ID = b"\xff\x00"
+SCROLL_END_ID = b"\xff\xff"
+SCROLL_IMAGE_TYPE = 0x00
+SCROLL_HEADER_SIZE = 7
+# Far above any liveview frame, a larger size means we synced on a false start ID
+SCROLL_MAX_DATA_SIZE = 8 * 1024 * 1024
+
+# A stream left unread this long holds stale frames, so it is reopened instead of read
+LIVEVIEW_STREAM_IDLE_TIMEOUT = 1.0
+
 
 class CanonCamera:
     """Canon Camera CCAPI interface"""
 
-    def __init__(self, ip: str = None, port: int = 8080):
+    def __init__(self, ip: str = None, port: int = 8080, liveview_stream: bool = None):
         self.ip = ip or os.environ.get("CANON_IP", None)
         self.port = port
         self.base_url = f"http://{self.ip}:{self.port}"
 
+        # Pull liveview frames from one persistent scroll connection instead of one request per frame
+        if liveview_stream is None:
+            liveview_stream = os.environ.get("CANON_LIVEVIEW_STREAM", "").lower() in ("1", "true", "yes")
+        self.liveview_stream = liveview_stream
+        self._liveview_frames = None
+        self._liveview_last_read = 0.0
+
+        # Keep connections to the camera alive between CCAPI calls
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self._session.mount("http://", adapter)
+
+        # setting_name -> (fetched_at, setting info)
+        self._setting_cache: dict[str, tuple[float, dict]] = {}
+        # (fetched_at, all settings)
+        self._all_settings_cache: tuple[float, dict] | None = None
+
     def _get(self, path: str) -> requests.Response:
         """Execute GET request"""
         url = f"{self.base_url}{path}"
         logger.info(f"GET: {url}")
-        response = requests.get(url, timeout=10)
+        response = self._session.get(url, timeout=10)
         response.raise_for_status()
         return response
 
@@ -28,32 +66,83 @@ class CanonCamera:
         """Execute PUT request"""
         url = f"{self.base_url}{path}"
         logger.info(f"PUT: {url} <- {data}")
-        response = requests.put(url, json=data, timeout=10)
+        response = self._session.put(url, json=data, timeout=10)
         response.raise_for_status()
         return response
 
+    @staticmethod
+    def _json(response: requests.Response) -> dict:
+        """Parse a CCAPI JSON response body"""
+        if orjson is not None:
+            try:
+                return orjson.loads(response.content)
+            except orjson.JSONDecodeError as e:
+                # Match response.json() so a bad body is still reported as a communication error
+                raise requests.exceptions.JSONDecodeError(e.msg, e.doc, e.pos, response=response) from e
+        return response.json()
+
     def get_all_settings(self) -> dict:
         """Get all shooting settings"""
         response = self._get("/ccapi/ver100/shooting/settings")
-        return response.json()
+        result = self._json(response)
+        self._all_settings_cache = (time.monotonic(), result)
+        return dict(result)
+
+    def get_all_settings_cached(self, ttl: float = SETTING_CACHE_TTL) -> dict:
+        """Get all shooting settings, reusing a recent response if there is one"""
+        cached = self._all_settings_cache
+        if cached is not None and time.monotonic() - cached[0] < ttl:
+            return dict(cached[1])
+        return self.get_all_settings()
 
     def get_setting(self, setting_name: str) -> dict:
         """Get specific shooting setting"""
         response = self._get(f"/ccapi/ver100/shooting/settings/{setting_name}")
-        return response.json()
-
-    def set_setting(self, setting_name: str, value: str) -> dict:
-        """Set specific shooting setting"""
-        # First get current setting to validate
-        current = self.get_setting(setting_name)
-
-        if "ability" in current and value not in current["ability"]:
-            raise ValueError(f"Invalid value '{value}' for {setting_name}. "
-                             f"Available options: {current['ability']}")
-
-        response = self._put(f"/ccapi/ver100/shooting/settings/{setting_name}",
-                             {"value": value})
-        response.raise_for_status()
+        result = self._json(response)
+        self._setting_cache[setting_name] = (time.monotonic(), result)
+        return dict(result)
+
+    def get_setting_cached(self, setting_name: str, ttl: float = SETTING_CACHE_TTL) -> dict:
+        """Get specific shooting setting, reusing a recent response if there is one"""
+        now = time.monotonic()
+        cached = self._setting_cache.get(setting_name)
+        if cached is not None and now - cached[0] < ttl:
+            return dict(cached[1])
+
+        # A recent all-settings response carries the same info for this setting
+        cached_all = self._all_settings_cache
+        if cached_all is not None and now - cached_all[0] < ttl:
+            setting = cached_all[1].get(setting_name)
+            if isinstance(setting, dict):
+                return dict(setting)
+
+        return self.get_setting(setting_name)
+
+    def set_setting(self, setting_name: str, value: str, validate: bool = True) -> dict:
+        """Set specific shooting setting, skipping the ability check if validate is False"""
+        if validate:
+            # First get current setting to validate
+            current = self.get_setting_cached(setting_name)
+
+            if "ability" in current and value not in current["ability"]:
+                raise ValueError(f"Invalid value '{value}' for {setting_name}. "
+                                 f"Available options: {current['ability']}")
+        else:
+            # Caller already validated, only report a previous value we happen to have fresh
+            cached = self._setting_cache.get(setting_name)
+            fresh = cached is not None and time.monotonic() - cached[0] < SETTING_CACHE_TTL
+            current = dict(cached[1]) if fresh else {}
+
+        self._put(f"/ccapi/ver100/shooting/settings/{setting_name}", {"value": value})
+
+        if current:
+            self._setting_cache[setting_name] = (time.monotonic(), {**current, "value": value})
+        else:
+            self._setting_cache.pop(setting_name, None)
+        if self._all_settings_cache is not None:
+            all_settings = self._all_settings_cache[1]
+            if isinstance(all_settings.get(setting_name), dict):
+                all_settings[setting_name] = {**all_settings[setting_name], "value": value}
 
         # Return updated setting info
         return {
@@ -67,23 +156,98 @@ class CanonCamera:
         try:
             url = f"{self.base_url}/ccapi/ver100/shooting/liveview/"
             body = {"liveviewsize": liveviewsize, "cameradisplay": cameradisplay}
-            res = requests.post(url, json=body)
+            res = self._session.post(url, json=body)
             return res.status_code
         except Exception as e:
             logger.error(f"Failed to init live view {e}")
             raise
 
-    def get_liveview_image(self) -> str:
-        """Get live view image as base64 string"""
+    def stream_liveview(self, chunk_size: int = 64 * 1024):
+        """
+        Yield live view JPEG frames from a single persistent scroll connection.
+
+        When several frames arrive in one read only the newest is yielded, but frames
+        still queued in the socket are not skipped, so a slow reader can lag behind.
+        get_liveview_bytes() reopens the stream after LIVEVIEW_STREAM_IDLE_TIMEOUT to avoid that.
+        """
+        url = f"{self.base_url}/ccapi/ver100/shooting/liveview/scroll"
+        logger.info(f"Opening live view stream: {url}")
+        response = self._session.get(url, stream=True, timeout=15)
+        response.raise_for_status()
+
+        buf = bytearray()
         try:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                buf += chunk
+                frame = None
+                while len(buf) >= SCROLL_HEADER_SIZE:
+                    if not buf.startswith(SCROLL_START_ID):
+                        # Out of sync, skip ahead to the next possible start ID
+                        start = buf.find(SCROLL_START_ID, 1)
+                        del buf[:start if start > 0 else len(buf) - 1]
+                        continue
+                    size = int.from_bytes(buf[3:SCROLL_HEADER_SIZE], "big")
+                    if size > SCROLL_MAX_DATA_SIZE:
+                        del buf[:1]
+                        continue
+                    end = SCROLL_HEADER_SIZE + size
+                    if len(buf) < end + len(SCROLL_END_ID):
+                        break
+                    if buf[end:end + len(SCROLL_END_ID)] != SCROLL_END_ID:
+                        del buf[:1]
+                        continue
+                    if buf[2] == SCROLL_IMAGE_TYPE:
+                        with memoryview(buf)[SCROLL_HEADER_SIZE:end] as data:
+                            frame = bytes(data)
+                    del buf[:end + len(SCROLL_END_ID)]
+                if frame is not None:
+                    yield frame
+        finally:
+            response.close()
+
+    def _next_liveview_frame(self) -> bytes:
+        """Get the next frame from the persistent liveview stream, reopening it once if it dropped"""
+        if (self._liveview_frames is not None
+                and time.monotonic() - self._liveview_last_read > LIVEVIEW_STREAM_IDLE_TIMEOUT):
+            # Frames queued while nobody was reading predate any settings change, start fresh
+            self._liveview_frames.close()
+            self._liveview_frames = None
+
+        for attempt in range(2):
+            if self._liveview_frames is None:
+                self._liveview_frames = self.stream_liveview()
+            try:
+                frame = next(self._liveview_frames)
+                self._liveview_last_read = time.monotonic()
+                return frame
+            except StopIteration:
+                self._liveview_frames = None
+            except requests.exceptions.RequestException as e:
+                # Idle persistent connections get dropped by the camera or network
+                self._liveview_frames = None
+                if attempt:
+                    raise
+                logger.info(f"Live view stream dropped, reconnecting: {e}")
+            except Exception:
+                self._liveview_frames = None
+                raise
+        raise requests.exceptions.ConnectionError("Live view stream closed by camera")
+
+    def get_liveview_bytes(self) -> bytes:
+        """Get live view image as raw JPEG bytes"""
+        try:
+            if self.liveview_stream:
+                return self._next_liveview_frame()
+
             url = f"{self.base_url}/ccapi/ver100/shooting/liveview/flip"
             logger.info(f"Getting live view: {url}")
-            response = requests.get(url, stream=True, timeout=15)
+            response = self._session.get(url, stream=False, timeout=15)
             response.raise_for_status()
-
-            # Convert to base64
-            image_data = f"{base64.b64encode(response.content).decode('utf-8')}\n"
-            return image_data
+            return response.content
         except Exception as e:
             logger.error(f"Failed to get live view: {e}")
             raise
+
+    def get_liveview_image(self) -> str:
+        """Get live view image as base64 string"""
+        return f"{base64.b64encode(self.get_liveview_bytes()).decode('utf-8')}\n"
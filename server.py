@@ -5,9 +5,10 @@ A minimal MCP server for controlling Canon cameras via CCAPI using FastMCP
 """
 import io
 import json
+import math
 import os
-import base64
 import typing
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 import logging
@@ -15,7 +16,13 @@ from typing import Literal
 
 from mcp.server.fastmcp import FastMCP, Image
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from PIL import Image as PILImage
+from PIL import __version__ as PIL_VERSION
 
 from canon_camera import CanonCamera
 
@@ -23,49 +30,177 @@ from canon_camera import CanonCamera
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("canon-camera-mcp")
 
+# Maximum size of the liveview image returned to the client
+LIVEVIEW_TARGET_SIZE_MB = 1
+
+# Error payloads always have the same shape, only the message needs escaping
+_COMM_ERR_TMPL = '{{\n  "success": false,\n  "error": "camera_communication_error",\n  "message": {msg}\n}}'
+_INVALID_PARAM_TMPL = '{{\n  "success": false,\n  "error": "invalid_parameter",\n  "message": {msg}\n}}'
+_INTERNAL_ERR_TMPL = '{{\n  "success": false,\n  "error": "internal_error",\n  "message": {msg}\n}}'
+
+# Register the core plugins, JPEG included, once at import rather than on the first open
+PILImage.preinit()
+
+# Settings exposed by the tools, as ordered tuples for output and frozensets for lookups
+_KEYS_TO_KEEP = ("av", "tv", "iso", "shootingmodedial")
+_VALID_SETTINGS = frozenset(_KEYS_TO_KEEP)
+_SETTABLE_KEYS = ("av", "tv", "iso")
+_VALID_SET_SETTINGS = frozenset(_SETTABLE_KEYS)
+
+# Pillow releases the GIL while encoding, so on multi-core hosts two candidate
+# qualities can be encoded at once. Shared across calls to avoid thread startup cost.
+_jpeg_executor = None
+if int(PIL_VERSION.split(".")[0]) >= 9 and (os.cpu_count() or 1) > 1:
+    _jpeg_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="jpeg-encode")
+
+
+
+
+
+def _json_dumps(obj) -> str:
+    """Serialize a successful tool response as compact JSON"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, separators=(",", ":"))
+
+
+def _buffer_bytes(buf):
+    """Copy the written part of a BytesIO out without an intermediate getvalue()"""
+    with buf.getbuffer() as view:
+        return bytes(view[:buf.tell()])
 
 
+def _encode_jpeg(pil_img, buf, quality, optimize=False):
+    """
+    Encode pil_img as JPEG into buf, replacing its contents, and return the encoded size.
+
+    Search attempts skip the extra Huffman optimization pass; pass optimize=True for
+    the final encode only.
+    """
+    buf.seek(0)
+    buf.truncate(0)
+    pil_img.save(buf, format="JPEG", quality=quality, optimize=optimize, subsampling=2, progressive=False)
+    return buf.tell()
+
+
+def _quality_search(pil_img, buf, target_size_bytes, lo, hi, best_quality=None):
+    """
+    Binary search for the highest JPEG quality in [lo, hi] that fits within the target size.
+    Returns best_quality if nothing in the range fits.
+    """
+    while lo <= hi:
+        quality = (lo + hi) // 2
+        img_size = _encode_jpeg(pil_img, buf, quality)
+
+        if img_size <= target_size_bytes:
+            best_quality = quality
+            # Close enough to the target, no need to keep searching
+            if img_size >= target_size_bytes * 0.975:
+                break
+            lo = quality + 1
+        else:
+            hi = quality - 1
+
+    return best_quality
 
 
-def compress_image_to_target_size(pil_img, target_size_mb=1, format="JPEG"):
+def _parallel_quality_search(pil_img, buf, target_size_bytes, lo, hi, best_quality=None):
+    """
+    Same as _quality_search, but encodes two candidate qualities per round on
+    _jpeg_executor, cutting the interval into thirds instead of halves.
+    """
+    if hi - lo < 2:
+        # No parallel round would run, so don't pay for the second image
+        return _quality_search(pil_img, buf, target_size_bytes, lo, hi, best_quality)
+
+    # save() stores encoder options on the image, so the second worker needs its own copy
+    images = (pil_img, pil_img.copy())
+    bufs = (buf, io.BytesIO())
+
+    while hi - lo >= 2:
+        q_lo = lo + (hi - lo) // 3
+        q_hi = hi - (hi - lo) // 3
+        futures = [_jpeg_executor.submit(_encode_jpeg, img, b, q)
+                   for img, b, q in zip(images, bufs, (q_lo, q_hi))]
+        size_lo, size_hi = (future.result() for future in futures)
+
+        if size_hi <= target_size_bytes:
+            best_quality = q_hi
+            if size_hi >= target_size_bytes * 0.975:
+                return best_quality
+            lo = q_hi + 1
+        elif size_lo <= target_size_bytes:
+            best_quality = q_lo
+            if size_lo >= target_size_bytes * 0.975:
+                return best_quality
+            lo, hi = q_lo + 1, q_hi - 1
+        else:
+            hi = q_lo - 1
+
+    # One or two candidates left, not worth a round trip through the pool
+    return _quality_search(pil_img, buf, target_size_bytes, lo, hi, best_quality)
+
+
+def compress_image_to_target_size(pil_img, target_size_mb=1, format="JPEG", original_bytes=None):
     """
     Compress a PIL image to approximately the target size in MB.
     < Written by ChatGPT >
 
     Args:
-        pil_img: PIL Image object
+        pil_img: PIL Image object, already in RGB or L mode when saving as JPEG
         target_size_mb: Target size in megabytes (default: 1)
         format: Image format ("JPEG" or "PNG")
+        original_bytes: Already encoded image data, returned as-is if it fits the target
 
     Returns:
         bytes: Compressed image data
     """
     target_size_bytes = target_size_mb * 1024 * 1024  # Convert MB to bytes
 
-    # Convert to RGB if saving as JPEG (JPEG doesn't support transparency)
-    if format.upper() == "JPEG" and pil_img.mode in ("RGBA", "P"):
-        pil_img = pil_img.convert("RGB")
-
-    # Start with high quality and reduce if needed
-    quality = 95
-    min_quality = 10
-
-    while quality >= min_quality:
-        img_byte_arr = io.BytesIO()
-
-        if format.upper() == "JPEG":
-            pil_img.save(img_byte_arr, format="JPEG", quality=quality, optimize=True)
-        else:
-            # For PNG, use optimization
-            pil_img.save(img_byte_arr, format="PNG", optimize=True)
+    # Nothing to do if the source encoding already fits
+    if original_bytes is not None and len(original_bytes) <= target_size_bytes:
+        return original_bytes
 
-        img_size = img_byte_arr.tell()
+    # A single buffer is reused across encode attempts
+    img_byte_arr = io.BytesIO()
 
-        if img_size <= target_size_bytes:
-            return img_byte_arr.getvalue()
+    if format.upper() != "JPEG":
+        # PNG has no quality knob, a single optimized encode is all we can do
+        pil_img.save(img_byte_arr, format="PNG", optimize=True)
+        if img_byte_arr.tell() <= target_size_bytes:
+            return _buffer_bytes(img_byte_arr)
+        return resize_and_compress_image(pil_img, target_size_bytes, format)
 
-        # Reduce quality for next iteration
-        quality -= 5
+    min_quality = 10
+    max_quality = 95
+    probe_quality = 75
+    lo, hi = min_quality, max_quality
+    best_quality = None
+
+    # Probe once at medium quality to decide whether the image needs shrinking first
+    probe_size = _encode_jpeg(pil_img, img_byte_arr, probe_quality)
+
+    if probe_size > target_size_bytes * 1.5:
+        # Encoded size scales roughly with pixel count, so resize once before searching
+        scale_factor = math.sqrt(target_size_bytes / probe_size)
+        width, height = pil_img.size
+        new_size = (max(1, int(width * scale_factor)), max(1, int(height * scale_factor)))
+        pil_img = pil_img.resize(new_size, PILImage.Resampling.LANCZOS)
+    elif probe_size <= target_size_bytes:
+        best_quality = probe_quality
+        lo = probe_quality + 1
+    else:
+        hi = probe_quality - 1
+
+    if _jpeg_executor is not None:
+        best_quality = _parallel_quality_search(pil_img, img_byte_arr, target_size_bytes, lo, hi, best_quality)
+    else:
+        best_quality = _quality_search(pil_img, img_byte_arr, target_size_bytes, lo, hi, best_quality)
+
+    if best_quality is not None:
+        # Huffman optimization only ever shrinks the output, so it is safe to apply once at the end
+        _encode_jpeg(pil_img, img_byte_arr, best_quality, optimize=True)
+        return _buffer_bytes(img_byte_arr)
 
     # If still too large, resize the image
     return resize_and_compress_image(pil_img, target_size_bytes, format)
@@ -74,34 +209,53 @@ def compress_image_to_target_size(pil_img, target_size_mb=1, format="JPEG"):
 def resize_and_compress_image(pil_img, target_size_bytes, format="JPEG"):
     """
     Resize and compress image if quality reduction alone isn't enough.
+
+    Binary searches the scale factor using cheap bilinear resizes, then resizes
+    once more with LANCZOS at the winning scale for the returned image.
     """
     original_width, original_height = pil_img.size
-    scale_factor = 0.9  # Start by reducing size by 10%
-    img_byte_arr = None
-
-    while scale_factor > 0.1:  # Don't go below 10% of original size
-        new_width = int(original_width * scale_factor)
-        new_height = int(original_height * scale_factor)
+    min_scale, max_scale = 0.1, 0.9  # Don't go below 10% of original size
+    search_steps = 4
+    img_byte_arr = io.BytesIO()
 
-        resized_img = pil_img.resize((new_width, new_height), PILImage.Resampling.LANCZOS)
-
-        # Try with medium quality after resizing
-        img_byte_arr = io.BytesIO()
+    def resize(scale_factor, resample):
+        new_size = (max(1, int(original_width * scale_factor)), max(1, int(original_height * scale_factor)))
+        return pil_img.resize(new_size, resample)
 
+    def encode(img, optimize=False):
+        # Medium quality after resizing
         if format.upper() == "JPEG":
-            resized_img.save(img_byte_arr, format="JPEG", quality=75, optimize=True)
+            return _encode_jpeg(img, img_byte_arr, 75, optimize=optimize)
+        img_byte_arr.seek(0)
+        img_byte_arr.truncate(0)
+        img.save(img_byte_arr, format="PNG", optimize=True)
+        return img_byte_arr.tell()
+
+    lo, hi = min_scale, max_scale
+    best_scale, best_img = None, None
+
+    # Try the mildest reduction first, then bisect towards the largest scale that fits
+    scale_factor = max_scale
+    for _ in range(search_steps):
+        resized_img = resize(scale_factor, PILImage.Resampling.BILINEAR)
+        if encode(resized_img) <= target_size_bytes:
+            best_scale, best_img = scale_factor, resized_img
+            if scale_factor == max_scale:
+                break
+            lo = scale_factor
         else:
-            resized_img.save(img_byte_arr, format="PNG", optimize=True)
-
-        img_size = img_byte_arr.tell()
+            hi = scale_factor
+        scale_factor = (lo + hi) / 2
 
-        if img_size <= target_size_bytes:
-            return img_byte_arr.getvalue()
+    if best_scale is None:
+        # If still too large, return the smallest version
+        encode(resize(min_scale, PILImage.Resampling.BILINEAR), optimize=True)
+        return _buffer_bytes(img_byte_arr)
 
-        scale_factor -= 0.1
-
-    # If still too large, return the smallest version
-    return img_byte_arr.getvalue()
+    # LANCZOS keeps more detail, which can cost a few bytes, so keep the bilinear result as a fallback
+    if encode(resize(best_scale, PILImage.Resampling.LANCZOS), optimize=True) > target_size_bytes:
+        encode(best_img, optimize=True)
+    return _buffer_bytes(img_byte_arr)
 
 
 
@@ -123,45 +277,36 @@ def get_camera_settings(setting: Literal["all", "av", "tv", "iso"]) -> str:
     """
     try:
         if setting == "all":
-            result = camera.get_all_settings()
+            result = camera.get_all_settings_cached()
             # Filter the result to only the keys
-            keys_to_keep = ["av", "tv", "iso", "shootingmodedial"]
-            result = {key: result[key] for key in keys_to_keep if key in result}
+            result = {key: result[key] for key in _KEYS_TO_KEEP if key in result}
 
         else:
-            valid_settings = ["av", "tv", "iso", "shootingmodedial"]
-            if setting not in valid_settings:
-                raise ValueError(f"Invalid setting '{setting}'. Valid options: {valid_settings}")
-
-            result = camera.get_setting(setting)
+            if setting not in _VALID_SETTINGS:
+                raise ValueError(f"Invalid setting '{setting}'. Valid options: {list(_KEYS_TO_KEEP)}")
+
+            result = camera.get_all_settings_cached().get(setting)
+            if isinstance(result, dict):
+                result = dict(result)
+            else:
+                # Older firmwares don't report every setting in the combined response
+                result = camera.get_setting_cached(setting)
             result["setting_name"] = setting
 
-        res = json.dumps(result, indent=2)
+        res = _json_dumps(result)
         return res
 
     except requests.exceptions.RequestException as e:
         logger.error(f"Camera communication error: {e}")
-        return json.dumps({
-            "success": False,
-            "error": "camera_communication_error",
-            "message": f"Failed to communicate with camera: {str(e)}"
-        }, indent=2)
+        return _COMM_ERR_TMPL.format(msg=json.dumps(f"Failed to communicate with camera: {str(e)}"))
 
     except ValueError as e:
         logger.error(f"Invalid parameter: {e}")
-        return json.dumps({
-            "success": False,
-            "error": "invalid_parameter",
-            "message": str(e)
-        }, indent=2)
+        return _INVALID_PARAM_TMPL.format(msg=json.dumps(str(e)))
 
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
-        return json.dumps({
-            "success": False,
-            "error": "internal_error",
-            "message": f"Unexpected error: {str(e)}"
-        }, indent=2)
+        return _INTERNAL_ERR_TMPL.format(msg=json.dumps(f"Unexpected error: {str(e)}"))
 
 
 @mcp.tool()
@@ -174,39 +319,26 @@ def set_camera_setting(setting: str, value: str) -> str:
         value: Value to set (must be from the setting's ability list)
     """
     try:
-        valid_settings = ["av", "tv", "iso"]
-        if setting not in valid_settings:
-            raise ValueError(f"Invalid setting '{setting}'. Valid options: {valid_settings}")
+        if setting not in _VALID_SET_SETTINGS:
+            raise ValueError(f"Invalid setting '{setting}'. Valid options: {list(_SETTABLE_KEYS)}")
 
         if not value:
             raise ValueError("Value is required")
 
         result = camera.set_setting(setting, value)
-        return json.dumps(result, indent=2)
+        return _json_dumps(result)
 
     except requests.exceptions.RequestException as e:
         logger.error(f"Camera communication error: {e}")
-        return json.dumps({
-            "success": False,
-            "error": "camera_communication_error",
-            "message": f"Failed to communicate with camera: {str(e)}"
-        }, indent=2)
+        return _COMM_ERR_TMPL.format(msg=json.dumps(f"Failed to communicate with camera: {str(e)}"))
 
     except ValueError as e:
         logger.error(f"Invalid parameter: {e}")
-        return json.dumps({
-            "success": False,
-            "error": "invalid_parameter",
-            "message": str(e)
-        }, indent=2)
+        return _INVALID_PARAM_TMPL.format(msg=json.dumps(str(e)))
 
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
-        return json.dumps({
-            "success": False,
-            "error": "internal_error",
-            "message": f"Unexpected error: {str(e)}"
-        }, indent=2)
+        return _INTERNAL_ERR_TMPL.format(msg=json.dumps(f"Unexpected error: {str(e)}"))
 
 
 @mcp.tool()
@@ -217,34 +349,37 @@ def get_liveview() -> typing.Union[Image, str]:
     Returns an image.
     """
     try:
-        image_data_b64 = camera.get_liveview_image()
-        image_data_bytes = base64.b64decode(image_data_b64)
-        pil_img = PILImage.open(io.BytesIO(image_data_bytes))
+        image_data_bytes = camera.get_liveview_bytes()
+
+        if len(image_data_bytes) <= LIVEVIEW_TARGET_SIZE_MB * 1024 * 1024:
+            # Camera JPEG already fits, skip the decode/re-encode round trip
+            compressed_img_bytes = image_data_bytes
+        else:
+            # BytesIO shares the bytes object's buffer until written to, so this doesn't copy the frame
+            pil_img = PILImage.open(io.BytesIO(image_data_bytes))
+            # Convert once up front rather than on every encode attempt
+            if pil_img.mode not in ("RGB", "L"):
+                pil_img = pil_img.convert("RGB")
+
+            # Compress the image to ~1MB
+            compressed_img_bytes = compress_image_to_target_size(
+                pil_img, target_size_mb=LIVEVIEW_TARGET_SIZE_MB, format="JPEG")
 
-        # Compress the image to ~1MB
-        compressed_img_bytes = compress_image_to_target_size(pil_img, target_size_mb=1, format="JPEG")
         img = Image(data=compressed_img_bytes, format="jpeg")
-        img_content = img.to_image_content()
-        logger.info(f"Image content: {img_content}")
+        if logger.isEnabledFor(logging.DEBUG):
+            # Base64 encodes the whole frame, so only pay for it when debugging
+            logger.debug(f"Image content: {img.to_image_content()}")
         logger.info(f"Compressed image size: {len(compressed_img_bytes) / (1024 * 1024):.2f} MB")
 
         return img
 
     except requests.exceptions.RequestException as e:
         logger.error(f"Camera communication error: {e}")
-        return json.dumps({
-            "success": False,
-            "error": "camera_communication_error",
-            "message": f"Failed to communicate with camera: {str(e)}"
-        }, indent=2)
+        return _COMM_ERR_TMPL.format(msg=json.dumps(f"Failed to communicate with camera: {str(e)}"))
 
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
-        return json.dumps({
-            "success": False,
-            "error": "internal_error",
-            "message": f"Unexpected error: {str(e)}"
-        }, indent=2)
+        return _INTERNAL_ERR_TMPL.format(msg=json.dumps(f"Unexpected error: {str(e)}"))
 
 
 def main():